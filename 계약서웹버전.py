@@ -1,14 +1,32 @@
 import streamlit as st
-import pandas as pd
-import gspread
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 import re
-from pdfminer.high_level import extract_pages
-from pdfminer.layout import LTTextContainer
 import urllib.parse
-import fitz
-from PIL import Image
 import io
+import csv
+import tempfile
+import os
+import gzip
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+# 스크립트 실행 시작 시각 (화면 표시 시간 측정용)
+_RUN_STARTED_AT = time.perf_counter()
+
+# pandas, gspread, pdfminer, fitz(PyMuPDF), PIL은 import 비용이 커서
+# 로그인 화면에서는 불러오지 않고, 처음 필요한 함수 안에서 불러옵니다.
+
+# 로그인 화면에서 미리 불러온 시트 데이터를 사용할 수 있는 최대 경과 시간(초)
+PREWARM_MAX_AGE_SECONDS = 60
+# 로그인 직후 예열 결과를 기다리는 최대 시간(초). 넘으면 직접 조회
+PREWARM_WAIT_SECONDS = 1
+# 서비스 계정 하나가 모든 세션에서 쓸 수 있는 Sheets API 분당 요청 수 (사용자당 기본 할당량)
+SHEETS_API_REQUESTS_PER_MINUTE = 60
+# 할당량 때문에 이 시간(초) 이상 기다려야 하면 화면에 대기 안내를 표시
+SHEETS_API_WAIT_NOTICE_SECONDS = 1
 
 # --------------------------------------------------------------------------
 # 1. Google Sheets 연동 및 데이터 처리 함수
@@ -18,6 +36,9 @@ import io
 # PDF를 이미지로 변환하는 함수 (기본 페이지 변경)
 def convert_pdf_page_to_image(pdf_bytes, page_number=1): # ◀️ 이 숫자를 0에서 1로 변경
     """PDF 파일의 특정 페이지를 이미지 객체로 변환합니다."""
+    import fitz
+    from PIL import Image
+
     try:
         # 바이트 데이터로부터 PDF 문서 열기
         pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
@@ -47,23 +68,226 @@ def convert_pdf_page_to_image(pdf_bytes, page_number=1): # ◀️ 이 숫자를
         st.error(f"PDF를 이미지로 변환하는 중 오류 발생: {e}")
         return None
 
+class SheetsApiGate:
+    """모든 세션이 함께 쓰는 Sheets API 호출 관문입니다.
+
+    최근 60초 동안의 호출 수가 분당 할당량을 넘지 않도록 제한하고, 동시에 진행 중인
+    같은 조회는 한 번만 호출하여 결과를 나눠 씁니다.
+    on_wait를 넘기면 기다려야 할 때 한 번 호출합니다. (대기 시간(초) 또는 None 전달)
+    단, 다른 세션이 결과를 기다리는 조회를 직접 호출하는 동안에는 on_wait를 호출하지 않습니다.
+    """
+
+    def __init__(self, requests_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self._lock = threading.Lock()
+        # 진행 중인 조회: (조회 키, 쓰기 세대) -> 결과를 기다리는 정보
+        self._in_flight = {}
+        # 쓰기가 끝날 때마다 증가시켜, 쓰기 이전에 시작된 조회 결과를 공유하지 않도록 함
+        self._write_generation = 0
+        self._call_times = deque()
+        self._stats = {'calls': 0, 'coalesced': 0, 'throttled': 0, 'wait_seconds': 0.0, 'errors': 0}
+
+    def _prune_call_times(self, now):
+        """최근 60초보다 오래된 호출 기록을 지웁니다. (잠금을 잡은 상태에서 호출)"""
+        while self._call_times and now - self._call_times[0] > 60:
+            self._call_times.popleft()
+
+    def _acquire(self, on_wait=None):
+        """최근 60초 호출 수가 할당량보다 적어질 때까지 기다린 뒤 호출을 기록합니다."""
+        waited = 0.0
+        notified = False
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._prune_call_times(now)
+                if len(self._call_times) < self.requests_per_minute:
+                    self._call_times.append(now)
+                    self._stats['calls'] += 1
+                    if waited:
+                        self._stats['throttled'] += 1
+                        self._stats['wait_seconds'] += waited
+                    return
+                # 가장 오래된 호출이 60초 창을 벗어날 때까지 대기
+                wait_seconds = max(60 - (now - self._call_times[0]), 0.01)
+            if on_wait and not notified and waited + wait_seconds >= SHEETS_API_WAIT_NOTICE_SECONDS:
+                on_wait(wait_seconds)
+                notified = True
+            time.sleep(wait_seconds)
+            waited += wait_seconds
+
+    def call(self, func, *args, on_wait=None, **kwargs):
+        """속도 제한을 거쳐 API를 호출합니다."""
+        self._acquire(on_wait)
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self._stats['errors'] += 1
+            raise
+
+    def write(self, func, *args, on_wait=None, **kwargs):
+        """시트를 변경하는 API를 호출합니다. 이후의 조회는 새로 호출됩니다."""
+        try:
+            return self.call(func, *args, on_wait=on_wait, **kwargs)
+        finally:
+            with self._lock:
+                self._write_generation += 1
+
+    def read(self, key, func, *args, on_wait=None, **kwargs):
+        """조회 API를 호출합니다. 같은 키의 조회가 진행 중이면 그 결과를 함께 받습니다."""
+        notified = False
+        while True:
+            with self._lock:
+                flight_key = (key, self._write_generation)
+                flight = self._in_flight.get(flight_key)
+                is_leader = flight is None
+                if is_leader:
+                    flight = {'done': threading.Event(), 'completed': False, 'result': None, 'error': None}
+                    self._in_flight[flight_key] = flight
+                else:
+                    self._stats['coalesced'] += 1
+
+            if is_leader:
+                break
+
+            # 먼저 시작된 조회가 할당량 때문에 대기 중일 수 있으므로 오래 걸리면 안내
+            if not flight['done'].wait(SHEETS_API_WAIT_NOTICE_SECONDS):
+                if on_wait and not notified:
+                    on_wait(None)
+                    notified = True
+                flight['done'].wait()
+            if not flight['completed']:
+                # 먼저 시작한 세션이 중단됨(재실행 등): 결과가 없으므로 다시 조회
+                continue
+            if flight['error'] is not None:
+                raise flight['error']
+            # 여러 세션이 같은 결과 객체를 공유하므로 호출하는 쪽에서 수정하지 않아야 함
+            return flight['result']
+
+        # 다른 세션이 이 조회를 기다릴 수 있으므로, 먼저 시작한 쪽은 대기 중에 화면을 건드리지 않음
+        # (화면 호출 중 재실행 예외가 나면 기다리는 세션까지 영향을 받음)
+        try:
+            flight['result'] = self.call(func, *args, **kwargs)
+            flight['completed'] = True
+            return flight['result']
+        except Exception as e:
+            flight['error'] = e
+            flight['completed'] = True
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[flight_key]
+            flight['done'].set()
+
+    def metrics(self):
+        """할당량 사용 현황을 반환합니다."""
+        with self._lock:
+            self._prune_call_times(time.monotonic())
+            return dict(
+                self._stats,
+                calls_last_minute=len(self._call_times),
+                limit_per_minute=self.requests_per_minute,
+                in_flight=len(self._in_flight),
+            )
+
+@st.cache_resource(show_spinner=False)
+def get_sheets_api_gate():
+    """프로세스 전체에서 하나만 사용하는 Sheets API 호출 관문을 반환합니다."""
+    return SheetsApiGate(SHEETS_API_REQUESTS_PER_MINUTE)
+
+def _call_with_wait_notice(gate_method, *args, **kwargs):
+    """관문 메서드를 호출하고, 할당량 때문에 기다리는 동안 화면에 안내를 표시합니다."""
+    notice = st.empty()
+
+    def show_wait_notice(wait_seconds):
+        wait_text = f" (약 {wait_seconds:.0f}초)" if wait_seconds else ""
+        notice.info(f"⏳ Google Sheets 요청이 많아 잠시 기다리는 중입니다{wait_text}.")
+
+    try:
+        return gate_method(*args, on_wait=show_wait_notice, **kwargs)
+    finally:
+        notice.empty()
+
+def sheets_read(key, func, *args, **kwargs):
+    """공용 관문을 거쳐 시트 조회 API를 호출합니다. (스크립트 실행 중에만 사용)"""
+    return _call_with_wait_notice(get_sheets_api_gate().read, key, func, *args, **kwargs)
+
+def sheets_write(func, *args, **kwargs):
+    """공용 관문을 거쳐 시트 변경 API를 호출합니다. (스크립트 실행 중에만 사용)"""
+    return _call_with_wait_notice(get_sheets_api_gate().write, func, *args, **kwargs)
+
+@st.cache_resource(show_spinner=False)
+def open_worksheet(_service_account_info):
+    """Google Sheets 워크시트를 엽니다. 연결은 모든 세션이 함께 재사용합니다."""
+    import gspread
+
+    # gc = gspread.service_account(filename='credentials.json')
+    gc = gspread.service_account_from_dict(_service_account_info)
+    spreadsheet = get_sheets_api_gate().call(gc.open, "계약관리DB") # 실제 스프레드시트 이름으로 변경
+    # sheet1 속성은 시트 정보를 다시 조회하므로 같은 관문을 거쳐 가져옴
+    return get_sheets_api_gate().call(spreadsheet.get_worksheet, 0)
+
 def connect_to_sheet():
     """Google Sheets에 연결하고 워크시트 객체를 반환합니다."""
     try:
-        # gc = gspread.service_account(filename='credentials.json')
-        gc = gspread.service_account_from_dict(st.secrets["gcp_service_account"])
-        spreadsheet = gc.open("계약관리DB") # 실제 스프레드시트 이름으로 변경
-        worksheet = spreadsheet.sheet1
-        return worksheet
+        return open_worksheet(st.secrets["gcp_service_account"])
     except Exception as e:
         st.error(f"Google Sheets 연결에 실패했습니다: {e}")
         return None
 
-def get_data_as_dataframe(worksheet):
+@st.cache_resource(show_spinner=False)
+def get_background_executor():
+    """연결 예열 등 백그라운드 작업용 공용 스레드 풀을 반환합니다."""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="prewarm")
+
+def prewarm_sheet_data(service_account_info):
+    """시트 연결과 첫 데이터 조회를 미리 수행합니다. (백그라운드 스레드에서 실행)"""
+    # 로그인 직후 화면에서 바로 필요한 pandas도 함께 불러 둠
+    import pandas  # noqa: F401
+
+    worksheet = open_worksheet(service_account_info)
+    # 백그라운드 스레드에서는 화면에 안내를 표시할 수 없으므로 관문을 직접 사용
+    return time.monotonic(), get_sheets_api_gate().read('get_all_values', worksheet.get_all_values)
+
+def start_prewarm():
+    """세션당 한 번, 로그인 화면이 표시될 때 시트 예열 작업을 시작합니다."""
+    if 'prewarm_future' in st.session_state:
+        return
+    try:
+        # st.secrets는 백그라운드 스레드에서 읽을 수 없는 경우가 있어 여기서 미리 꺼내 전달
+        service_account_info = st.secrets["gcp_service_account"]
+    except Exception:
+        # 인증 정보가 없으면 예열을 건너뛰고, 로그인 후 연결 단계에서 오류를 표시
+        return
+    st.session_state['prewarm_future'] = get_background_executor().submit(prewarm_sheet_data, service_account_info)
+
+def take_prewarmed_data():
+    """예열 작업의 결과를 꺼냅니다. 실패했거나 오래된 데이터면 None을 반환합니다."""
+    prewarm_future = st.session_state.pop('prewarm_future', None)
+    if prewarm_future is None:
+        return None
+    try:
+        # 공용 스레드 풀에서 다른 세션의 예열 뒤에 밀려 있을 수 있으므로 오래 기다리지 않음
+        fetched_at, data = prewarm_future.result(timeout=PREWARM_WAIT_SECONDS)
+    except FutureTimeoutError:
+        prewarm_future.cancel()
+        return None
+    except Exception:
+        # 예열에 실패해도 아래에서 평소처럼 다시 조회하므로 무시
+        return None
+    if time.monotonic() - fetched_at > PREWARM_MAX_AGE_SECONDS:
+        return None
+    return data
+
+def get_data_as_dataframe(worksheet, data=None):
     """워크시트 데이터를 Pandas DataFrame으로 불러오고 기본 전처리를 수행합니다."""
+    import pandas as pd
+
     try:
+        # 미리 불러온 데이터가 없으면 시트에서 조회
+        if data is None:
+            data = sheets_read('get_all_values', worksheet.get_all_values)
         # 데이터가 없는 경우를 대비하여 빈 데이터프레임 생성
-        data = worksheet.get_all_values()
         if not data:
             # 헤더만 있는 경우 또는 완전히 비어있는 경우
             st.warning("시트에 데이터가 없습니다. 헤더를 확인해주세요.")
@@ -90,7 +314,88 @@ def get_data_as_dataframe(worksheet):
         st.error(f"데이터를 DataFrame으로 변환하는 중 오류 발생: {e}")
         return None
 
-def register_third_party_contract(worksheet, all_df):
+# 업로드된 계약서 원본을 보관하는 로컬 저장소 (파일 해시 기준으로 중복 없이 저장)
+CONTRACT_ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "contract_archive")
+
+def compute_file_hash(file_bytes):
+    """파일 내용의 SHA-256 해시값을 반환합니다."""
+    return hashlib.sha256(file_bytes).hexdigest()
+
+def store_contract_file(file_bytes, file_hash):
+    """계약서 파일을 해시값 경로에 압축 저장합니다. 같은 내용이 이미 있으면 다시 저장하지 않습니다."""
+    object_dir = os.path.join(CONTRACT_ARCHIVE_DIR, file_hash[:2])
+    object_path = os.path.join(object_dir, f"{file_hash}.gz")
+    if os.path.exists(object_path):
+        return object_path
+    os.makedirs(object_dir, exist_ok=True)
+    # 저장 도중 중단되어도 깨진 파일이 남지 않도록 임시 파일에 쓴 뒤 교체
+    with tempfile.NamedTemporaryFile(dir=object_dir, suffix=".tmp", delete=False) as tmp_file:
+        with gzip.GzipFile(fileobj=tmp_file, mode='wb') as gz_file:
+            gz_file.write(file_bytes)
+    os.replace(tmp_file.name, object_path)
+    return object_path
+
+def normalize_contract_key(customer_name, car_model, monthly_fee):
+    """(고객명, 대여차종, 월대여료)를 비교용 키로 정규화합니다. 비교할 정보가 부족하면 None을 반환합니다."""
+    name = re.sub(r'\s+', '', str(customer_name or ''))
+    car = re.sub(r'\s+', '', str(car_model or '')).upper()
+    fee = re.sub(r'\D', '', str(monthly_fee or ''))
+    if not name or not (car or fee):
+        return None
+    return (name, car, fee)
+
+# 중복 확인을 위해 등록 시 함께 기록하는 컬럼 (시트에 없으면 등록할 때 헤더에 추가)
+DUPLICATE_CHECK_HEADERS = ['대여차종', '월대여료', '파일해시']
+
+@st.cache_resource(show_spinner=False)
+def get_header_migration_lock():
+    """헤더 추가 작업을 한 세션씩 수행하도록 프로세스 전체에서 공유하는 잠금을 반환합니다."""
+    return threading.Lock()
+
+def ensure_duplicate_check_headers(worksheet, sheet_headers):
+    """중복 확인용 컬럼이 시트 헤더에 없으면 1행 끝에 추가하고, 갱신된 헤더 목록을 반환합니다."""
+    if all(h in sheet_headers for h in DUPLICATE_CHECK_HEADERS):
+        return sheet_headers
+    with get_header_migration_lock():
+        # 잠금을 기다리는 동안 다른 세션이 이미 추가했을 수 있으므로 1행을 다시 읽음
+        sheet_headers = sheets_read('row_values:1', worksheet.row_values, 1)
+        missing_headers = [h for h in DUPLICATE_CHECK_HEADERS if h not in sheet_headers]
+        if not missing_headers:
+            return sheet_headers
+        required_col_count = len(sheet_headers) + len(missing_headers)
+        if worksheet.col_count < required_col_count:
+            sheets_write(worksheet.add_cols, required_col_count - worksheet.col_count)
+        for offset, header in enumerate(missing_headers, start=1):
+            sheets_write(worksheet.update_cell, 1, len(sheet_headers) + offset, header)
+        return sheet_headers + missing_headers
+
+def build_duplicate_index(all_df):
+    """취소되지 않은 계약으로 파일 해시 색인과 (고객명, 대여차종, 월대여료) 색인을 만듭니다."""
+    active_df = all_df[all_df['상태'] != '취소'] if '상태' in all_df.columns else all_df
+    hash_index = set()
+    if '파일해시' in active_df.columns:
+        hash_index = {file_hash for file_hash in active_df['파일해시'] if file_hash}
+    key_index = set()
+    if '고객명' in active_df.columns:
+        empty = [''] * len(active_df)
+        car_models = active_df['대여차종'] if '대여차종' in active_df.columns else empty
+        monthly_fees = active_df['월대여료'] if '월대여료' in active_df.columns else empty
+        for customer_name, car_model, monthly_fee in zip(active_df['고객명'], car_models, monthly_fees):
+            contract_key = normalize_contract_key(customer_name, car_model, monthly_fee)
+            if contract_key:
+                key_index.add(contract_key)
+    return hash_index, key_index
+
+def find_duplicate_contract(duplicate_index, file_hash, contract_key):
+    """이미 등록된 계약인지 확인하고, 중복이면 그 사유를 반환합니다. 중복이 아니면 None을 반환합니다."""
+    hash_index, key_index = duplicate_index
+    if file_hash and file_hash in hash_index:
+        return "같은 계약서 파일이 이미 등록되어 있습니다."
+    if contract_key and contract_key in key_index:
+        return "고객명, 대여차종, 월대여료가 같은 계약이 이미 등록되어 있습니다. 같은 조건의 차량을 추가로 계약하는 경우 '추가'를 선택해주세요."
+    return None
+
+def register_third_party_contract(worksheet, all_df, duplicate_index):
     """타사 계약 등록 UI 및 로직을 처리합니다. (수기 입력 방식)"""
     st.header("📋 타사 계약 등록")
     st.info("계약서 파일을 업로드하고, 모든 정보를 직접 입력해주세요.")
@@ -183,8 +488,21 @@ def register_third_party_contract(worksheet, all_df):
                 "inflow_channel": inflow_channel
             }
 
+            # 중복 등록 확인 (파일 해시 및 고객명/대여차종/월대여료 기준)
+            file_bytes = uploaded_file.getvalue() if uploaded_file else None
+            file_hash = compute_file_hash(file_bytes) if file_bytes else ""
+            # '추가' 계약은 같은 고객/차종/월대여료가 정상이므로 파일 해시만 확인
+            contract_key = None if is_additional else normalize_contract_key(customer_name, car_model, monthly_fee)
+            duplicate_reason = find_duplicate_contract(duplicate_index, file_hash, contract_key)
+            if duplicate_reason:
+                st.error(f"중복 등록이 차단되었습니다: {duplicate_reason}")
+                return
+
             with st.spinner('Google Sheet에 데이터를 기록하는 중...'):
                 try:
+                    if file_bytes:
+                        store_contract_file(file_bytes, file_hash)
+
                     # 댓수 계산 로직 (기존과 동일)
                     current_date = datetime.now()
                     sales_person_name = user_inputs['sales_person']
@@ -195,15 +513,16 @@ def register_third_party_contract(worksheet, all_df):
                     total_office_salesperson_monthly_count = len(office_monthly_salesperson_df) + 1
                     
                     # 시트에 저장할 데이터 구성
-                    sheet_headers = worksheet.row_values(1)
+                    sheet_headers = ensure_duplicate_check_headers(worksheet, sheets_read('row_values:1', worksheet.row_values, 1))
                     new_row_dict = {
                         '담당자': sales_person_name, '고객명': customer_name, '계약접수처': reception_office,
                         '유입경로': inflow_channel, '날짜': current_date.strftime("%Y-%m-%d"),
                         '접수처월별': total_office_salesperson_monthly_count, '전체월별': total_salesperson_monthly_count,
-                        '상태': '정상', '추가': "O" if is_additional else "", '소개': "O" if is_referral else ""
+                        '상태': '정상', '추가': "O" if is_additional else "", '소개': "O" if is_referral else "",
+                        '대여차종': car_model, '월대여료': monthly_fee, '파일해시': file_hash
                     }
                     new_row_list = [new_row_dict.get(h, '') for h in sheet_headers]
-                    worksheet.append_row(new_row_list, value_input_option='USER_ENTERED')
+                    sheets_write(worksheet.append_row, new_row_list, value_input_option='USER_ENTERED')
                     
                     # 메일 생성을 위해 수기 입력 데이터를 딕셔너리 형태로 만듦
                     manual_data_for_mail = {
@@ -227,7 +546,7 @@ def register_third_party_contract(worksheet, all_df):
                 except Exception as e:
                     st.error(f"Google Sheet 처리 중 오류 발생: {e}")
 
-def register_novadeal_contract(worksheet, all_df):
+def register_novadeal_contract(worksheet, all_df, duplicate_index):
     """노바딜 계약 등록 UI 및 로직을 처리합니다. (파일 업로드 없는 수기 입력 방식)"""
     st.header("🚗 노바딜 계약 등록")
     st.info("모든 계약 정보를 직접 입력해주세요.")
@@ -284,6 +603,15 @@ def register_novadeal_contract(worksheet, all_df):
                 "inflow_channel": inflow_channel
             }
 
+            # 중복 등록 확인 (업로드 파일이 없으므로 고객명/대여차종/월대여료 기준)
+            file_hash = ""
+            # '추가' 계약은 같은 고객/차종/월대여료가 정상이므로 파일 해시만 확인
+            contract_key = None if is_additional else normalize_contract_key(customer_name, car_model, monthly_fee)
+            duplicate_reason = find_duplicate_contract(duplicate_index, file_hash, contract_key)
+            if duplicate_reason:
+                st.error(f"중복 등록이 차단되었습니다: {duplicate_reason}")
+                return
+
             with st.spinner('Google Sheet에 데이터를 기록하는 중...'):
                 try:
                     current_date = datetime.now()
@@ -294,15 +622,16 @@ def register_novadeal_contract(worksheet, all_df):
                     office_monthly_salesperson_df = current_month_salesperson_df[current_month_salesperson_df['계약접수처'] == reception_office]
                     total_office_salesperson_monthly_count = len(office_monthly_salesperson_df) + 1
                     
-                    sheet_headers = worksheet.row_values(1)
+                    sheet_headers = ensure_duplicate_check_headers(worksheet, sheets_read('row_values:1', worksheet.row_values, 1))
                     new_row_dict = {
                         '담당자': sales_person_name, '고객명': customer_name, '계약접수처': reception_office,
                         '유입경로': inflow_channel, '날짜': current_date.strftime("%Y-%m-%d"),
                         '접수처월별': total_office_salesperson_monthly_count, '전체월별': total_salesperson_monthly_count,
-                        '상태': '정상', '추가': "O" if is_additional else "", '소개': "O" if is_referral else ""
+                        '상태': '정상', '추가': "O" if is_additional else "", '소개': "O" if is_referral else "",
+                        '대여차종': car_model, '월대여료': monthly_fee, '파일해시': file_hash
                     }
                     new_row_list = [new_row_dict.get(h, '') for h in sheet_headers]
-                    worksheet.append_row(new_row_list, value_input_option='USER_ENTERED')
+                    sheets_write(worksheet.append_row, new_row_list, value_input_option='USER_ENTERED')
                     
                     manual_data_for_mail = {
                         '고객명': customer_name, '대여차종': car_model, '대여기간': rental_period,
@@ -329,11 +658,86 @@ def register_novadeal_contract(worksheet, all_df):
 # 2. PDF 계약서 분석 함수 (기존 코드 활용)
 # --------------------------------------------------------------------------
 
-def extract_specific_data_from_page2(pdf_file):
-    """PDF 파일의 2페이지에서 지정된 데이터를 추출합니다."""
+# 라벨 오른쪽의 값 후보(x좌표 순 텍스트 목록)에서 실제 값을 골라내는 파서들
+def parse_first_text(candidates):
+    """첫 번째 후보 텍스트를 그대로 값으로 사용합니다."""
+    return candidates[0] if candidates else None
+
+def parse_digits_only(candidates):
+    """숫자로만 이루어진 첫 번째 후보를 값으로 사용합니다."""
+    for text in candidates:
+        if text.isdigit():
+            return text
+    return None
+
+def parse_money(candidates):
+    """후보 중 처음 나오는 금액(숫자와 쉼표)을 값으로 사용합니다."""
+    for text in candidates:
+        match = re.search(r'[\d,]+', text)
+        if match:
+            return match.group(0)
+    return None
+
+def parse_deposit_prepayment(candidates):
+    """후보에서 금액을 모아 보증금 / 선납금 형식으로 만듭니다."""
+    money_values = []
+    for text in candidates:
+        money_values.extend(re.findall(r'\d{1,3}(?:,\d{3})*|\d+', text))
+    if len(money_values) >= 2:
+        return f"보증금: {money_values[0]} / 선납금: {money_values[1]}"
+    if len(money_values) == 1:
+        return f"보증금/선납금: {money_values[0]}"
+    return None
+
+def parse_car_model(candidates):
+    """첫 번째 후보의 차량 모델명을 간소화하여 사용합니다."""
+    return summarize_car_model(candidates[0]) if candidates else None
+
+# 리스사별 계약서 양식 목록
+# - fingerprint: 첫 페이지 텍스트(공백 제거)에 이 중 하나라도 있으면 해당 양식으로 인식
+# - page: 정보를 추출할 페이지 번호 (0은 첫 페이지)
+# - fields: 항목명 -> (찾을 라벨 목록, 값 파서)
+# 새 리스사 양식은 이 목록에 항목을 추가하면 자동 분석 대상이 됩니다.
+PDF_TEMPLATES = [
+    {
+        'name': '롯데렌탈',
+        'fingerprint': ['롯데렌탈', '롯데오토리스', 'LOTTE'],
+        'page': 1,
+        'fields': {
+            '고객명': (['고객명', '법인명'], parse_first_text),
+            '대여차종': (['대여차종'], parse_car_model),
+            '대여기간': (['대여기간'], parse_digits_only),
+            '월대여료': (['월 대여료(VAT포함)(1)'], parse_money),
+            '차량 소비자 가격': (['차량 소비자 가격', '차량소비자 가격'], parse_money),
+            '보증금 / 선납금': (['보증금 / 선납금'], parse_deposit_prepayment)
+        }
+    },
+]
+# 어떤 양식과도 일치하지 않을 때 사용할 양식 (기존 롯데 분석 방식 유지)
+DEFAULT_PDF_TEMPLATE = PDF_TEMPLATES[0]
+
+def match_pdf_template(pdf_bytes):
+    """PDF 첫 페이지 텍스트로 양식을 판별합니다. 일치하는 양식이 없으면 None을 반환합니다."""
+    import fitz
+
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf_document:
+        if len(pdf_document) == 0:
+            return None
+        # 레이아웃 분석 없이 첫 페이지의 텍스트만 빠르게 읽어 비교
+        first_page_text = re.sub(r'\s+', '', pdf_document.load_page(0).get_text())
+    for template in PDF_TEMPLATES:
+        if any(keyword in first_page_text for keyword in template['fingerprint']):
+            return template
+    return None
+
+def extract_contract_data(pdf_bytes, template):
+    """양식에 지정된 페이지만 분석하여 계약 정보를 추출합니다."""
+    from pdfminer.high_level import extract_pages
+    from pdfminer.layout import LTTextContainer
+
     try:
         extracted_blocks = []
-        for page_layout in extract_pages(pdf_file, page_numbers=[1]):
+        for page_layout in extract_pages(io.BytesIO(pdf_bytes), page_numbers=[template['page']]):
             for element in page_layout:
                 if isinstance(element, LTTextContainer):
                     extracted_blocks.append({
@@ -341,19 +745,10 @@ def extract_specific_data_from_page2(pdf_file):
                         'bbox': element.bbox
                     })
         
-        target_labels = {
-            '고객명': ['고객명', '법인명'],
-            '대여차종': ['대여차종'],
-            '대여기간': ['대여기간'],
-            '월대여료': ['월 대여료(VAT포함)(1)'],
-            '차량 소비자 가격': ['차량 소비자 가격', '차량소비자 가격'],
-            '보증금 / 선납금': ['보증금 / 선납금']
-        }
-        
         extracted_info = {}
         Y_TOLERANCE = 5
 
-        for key_name, label_list in target_labels.items():
+        for key_name, (label_list, value_parser) in template['fields'].items():
             found_value = "정보 없음"
             label_bbox = None
             for label_text in label_list:
@@ -373,34 +768,9 @@ def extract_specific_data_from_page2(pdf_file):
                         potential_values.append((block_x0, block['text']))
                 
                 potential_values.sort(key=lambda item: item[0])
-                
-                if key_name == '대여기간':
-                    for _, text in potential_values:
-                        if text.isdigit():
-                            found_value = text
-                            break
-                elif key_name in ['월대여료', '차량 소비자 가격']:
-                    for _, text in potential_values:
-                        match = re.search(r'[\d,]+', text)
-                        if match:
-                            found_value = match.group(0)
-                            break
-                elif key_name == '보증금 / 선납금':
-                    money_values = []
-                    for _, text in potential_values:
-                        matches = re.findall(r'\d{1,3}(?:,\d{3})*|\d+', text)
-                        money_values.extend(matches)
-                    if len(money_values) >= 2:
-                        found_value = f"보증금: {money_values[0]} / 선납금: {money_values[1]}"
-                    elif len(money_values) == 1:
-                        found_value = f"보증금/선납금: {money_values[0]}"
-                elif key_name == '대여차종':
-                    if potential_values:
-                        full_model_name = potential_values[0][1]
-                        found_value = summarize_car_model(full_model_name)
-                else:
-                    if potential_values:
-                        found_value = potential_values[0][1]
+                parsed_value = value_parser([text for _, text in potential_values])
+                if parsed_value:
+                    found_value = parsed_value
 
             extracted_info[key_name] = found_value
         return extracted_info
@@ -427,9 +797,13 @@ def show_login_screen():
     st.subheader("담당자 이름을 입력해주세요.")
     
     sales_person = st.text_input("담당자 이름", key="login_name_input")
+
+    # 이름을 입력하는 동안 시트 연결과 첫 데이터 조회를 백그라운드에서 진행
+    start_prewarm()
     
     if st.button("로그인", key="login_button"):
         if sales_person:
+            st.session_state['login_clicked_at'] = time.perf_counter()
             st.session_state['logged_in'] = True
             st.session_state['sales_person'] = sales_person
             st.rerun()
@@ -439,17 +813,22 @@ def show_login_screen():
 def show_main_app():
     """메인 애플리케이션 화면 UI를 표시합니다."""
     st.sidebar.header(f"👤 {st.session_state['sales_person']}님")
+    # 로그인 직후 첫 실행에서만 화면 표시 시간을 측정
+    # (아래에서 중간에 반환되어도 다음 실행으로 넘어가지 않도록 먼저 꺼냄)
+    login_clicked_at = st.session_state.pop('login_clicked_at', None)
+    if login_clicked_at is not None:
+        first_paint_seconds = time.perf_counter() - login_clicked_at
     
     # 1. 사이드바 메뉴를 새로운 상위 메뉴 구조로 변경
     mode = st.sidebar.radio(
         "원하는 작업을 선택하세요.",
-        ('내 계약 조회', '계약 등록', '계약 수정', '계약 취소') # ◀️ 메뉴 단순화
+        ('내 계약 조회', '계약 등록', '계약 수정', '계약 취소', '계약 내보내기')
     )
     
     worksheet = connect_to_sheet()
     if worksheet is None: return
 
-    df = get_data_as_dataframe(worksheet)
+    df = get_data_as_dataframe(worksheet, take_prewarmed_data())
     if df is None: return
 
     user_df = df[(df['담당자'] == st.session_state['sales_person']) & (df['상태'] != '취소')]
@@ -463,11 +842,34 @@ def show_main_app():
         edit_contract(worksheet, user_df)
     elif mode == '계약 취소':
         cancel_contract(worksheet, user_df)
+    elif mode == '계약 내보내기':
+        export_contracts(df)
 
     if st.sidebar.button("로그아웃"):
         st.session_state['logged_in'] = False
         st.rerun()
 
+    show_sheets_api_metrics()
+
+    if login_clicked_at is not None:
+        first_interactive_seconds = time.perf_counter() - login_clicked_at
+        st.sidebar.caption(
+            f"⏱️ 로그인 후 첫 화면 {first_paint_seconds:.2f}초 · "
+            f"조작 가능 {first_interactive_seconds:.2f}초 "
+            f"(이번 실행 {time.perf_counter() - _RUN_STARTED_AT:.2f}초)"
+        )
+
+def show_sheets_api_metrics():
+    """사이드바에 Sheets API 할당량 사용 현황을 표시합니다."""
+    metrics = get_sheets_api_gate().metrics()
+    with st.sidebar.expander("📊 API 사용량"):
+        usage_ratio = min(metrics['calls_last_minute'] / metrics['limit_per_minute'], 1.0)
+        st.progress(usage_ratio, text=f"최근 1분 {metrics['calls_last_minute']} / {metrics['limit_per_minute']}회")
+        st.caption(
+            f"누적 호출 {metrics['calls']}회 · 합쳐진 조회 {metrics['coalesced']}회 · "
+            f"대기 {metrics['throttled']}회 ({metrics['wait_seconds']:.1f}초) · 오류 {metrics['errors']}회"
+        )
+
 def view_contracts(user_df):
     """담당자의 계약 목록을 표시합니다."""
     st.header("나의 계약 목록")
@@ -491,6 +893,9 @@ def show_registration_submenu(worksheet, df):
     st.header("📑 계약 등록")
     st.info("등록할 계약 유형을 선택하세요.")
 
+    # 중복 확인용 색인은 데이터를 불러올 때마다 한 번만 만들고 세 등록 메뉴가 함께 사용
+    duplicate_index = build_duplicate_index(df)
+
     # st.tabs를 사용하여 세 가지 등록 메뉴를 생성
     tab_lotte, tab_third_party, tab_novadeal = st.tabs([
         "롯데 계약 (자동 분석)", 
@@ -501,17 +906,17 @@ def show_registration_submenu(worksheet, df):
     # 각 탭(Tab) 내부를 정의
     with tab_lotte:
         # '롯데 계약' 탭을 클릭하면 register_lotte_contract 함수가 실행됨
-        register_lotte_contract(worksheet, df)
+        register_lotte_contract(worksheet, df, duplicate_index)
 
     with tab_third_party:
         # '타사 계약' 탭을 클릭하면 register_third_party_contract 함수가 실행됨
-        register_third_party_contract(worksheet, df)
+        register_third_party_contract(worksheet, df, duplicate_index)
 
     with tab_novadeal:
         # '노바딜 계약' 탭을 클릭하면 register_novadeal_contract 함수가 실행됨
-        register_novadeal_contract(worksheet, df)
+        register_novadeal_contract(worksheet, df, duplicate_index)
 
-def register_lotte_contract(worksheet, all_df):
+def register_lotte_contract(worksheet, all_df, duplicate_index):
     """신규 계약 등록 UI 및 로직을 처리합니다. (입력폼 통합 버전)"""
     st.header("신규 계약 등록")
 
@@ -530,22 +935,38 @@ def register_lotte_contract(worksheet, all_df):
     # [변경] 파일 업로더만 남기고 다른 위젯들은 st.form 안으로 이동
     uploaded_file = st.file_uploader("계약서 PDF 파일을 업로드하세요.", type="pdf")
 
-    # (PDF 분석 로직은 동일)
+    # [변경] 첫 페이지로 양식을 판별한 뒤, 해당 양식이 필요로 하는 페이지만 분석
     if uploaded_file is not None:
         if 'last_uploaded_filename' not in st.session_state or st.session_state.last_uploaded_filename != uploaded_file.name:
             with st.spinner('계약서를 분석 중...'):
-                st.session_state.extracted_data = extract_specific_data_from_page2(uploaded_file)
+                pdf_bytes = uploaded_file.getvalue()
+                try:
+                    template = match_pdf_template(pdf_bytes)
+                except Exception as e:
+                    st.session_state.extracted_data = {"오류": str(e)}
+                    # 이전 업로드의 양식으로 미리보기하지 않도록 제거
+                    st.session_state.pop('pdf_template', None)
+                    template = None
+                else:
+                    if template is None:
+                        st.warning(f"등록된 계약서 양식과 일치하지 않아 '{DEFAULT_PDF_TEMPLATE['name']}' 양식으로 분석합니다.")
+                        template = DEFAULT_PDF_TEMPLATE
+                    st.session_state.pdf_template = template
+                    st.session_state.extracted_data = extract_contract_data(pdf_bytes, template)
                 st.session_state.last_uploaded_filename = uploaded_file.name
-                st.success("✅ 계약서 정보 추출 완료!")
+                if template:
+                    st.success(f"✅ 계약서 정보 추출 완료! (양식: {template['name']})")
     
     # (미리보기 로직은 동일)
     if uploaded_file: # 파일이 업로드된 상태라면 미리보기 섹션 표시
         with st.expander("📄 업로드된 계약서 미리보기 및 전체보기"):
             pdf_bytes = uploaded_file.getvalue()
-            st.markdown("##### 📄 두 번째 페이지 미리보기")
-            preview_image = convert_pdf_page_to_image(pdf_bytes)
+            # 인식된 양식의 추출 페이지를 미리보기로 표시
+            preview_page = st.session_state.get('pdf_template', DEFAULT_PDF_TEMPLATE)['page']
+            st.markdown(f"##### 📄 {preview_page + 1}페이지 미리보기")
+            preview_image = convert_pdf_page_to_image(pdf_bytes, page_number=preview_page)
             if preview_image:
-                st.image(preview_image, caption="계약서 두 번째 페이지", use_container_width=True)
+                st.image(preview_image, caption=f"계약서 {preview_page + 1}페이지", use_container_width=True)
             else:
                 st.warning("미리보기를 생성할 수 없습니다.")
             st.markdown("---")
@@ -597,9 +1018,22 @@ def register_lotte_contract(worksheet, all_df):
             if submit_button:
                 # (이하 제출 로직은 모두 동일)
                 user_inputs = { "sales_person": st.session_state['sales_person'], "reception_office": reception_office, "inflow_channel": inflow_channel }
+
+                # 중복 등록 확인 (파일 해시 및 고객명/대여차종/월대여료 기준)
+                file_bytes = uploaded_file.getvalue() if uploaded_file else None
+                file_hash = compute_file_hash(file_bytes) if file_bytes else ""
+                # '추가' 계약은 같은 고객/차종/월대여료가 정상이므로 파일 해시만 확인
+                contract_key = None if is_additional else normalize_contract_key(edited_data.get('고객명'), edited_data.get('대여차종'), edited_data.get('월대여료'))
+                duplicate_reason = find_duplicate_contract(duplicate_index, file_hash, contract_key)
+                if duplicate_reason:
+                    st.error(f"중복 등록이 차단되었습니다: {duplicate_reason}")
+                    return
                 
                 with st.spinner('Google Sheet에 데이터를 기록하는 중...'):
                     try:
+                        if file_bytes:
+                            store_contract_file(file_bytes, file_hash)
+
                         current_date = datetime.now()
                         sales_person_name = user_inputs['sales_person']
                         salesperson_df = all_df[all_df['담당자'] == sales_person_name]
@@ -608,7 +1042,7 @@ def register_lotte_contract(worksheet, all_df):
                         office_monthly_salesperson_df = current_month_salesperson_df[current_month_salesperson_df['계약접수처'] == reception_office]
                         total_office_salesperson_monthly_count = len(office_monthly_salesperson_df) + 1
                         
-                        sheet_headers = worksheet.row_values(1)
+                        sheet_headers = ensure_duplicate_check_headers(worksheet, sheets_read('row_values:1', worksheet.row_values, 1))
                         new_row_dict = {
                             '담당자': sales_person_name,
                             '고객명': edited_data.get('고객명', 'N/A'),
@@ -619,11 +1053,14 @@ def register_lotte_contract(worksheet, all_df):
                             '전체월별': total_salesperson_monthly_count,
                             '상태': '정상',
                             '추가': "O" if is_additional else "",
-                            '소개': "O" if is_referral else ""
+                            '소개': "O" if is_referral else "",
+                            '대여차종': edited_data.get('대여차종', ''),
+                            '월대여료': edited_data.get('월대여료', ''),
+                            '파일해시': file_hash
                         }
                         
                         new_row_list = [new_row_dict.get(h, '') for h in sheet_headers]
-                        worksheet.append_row(new_row_list, value_input_option='USER_ENTERED')
+                        sheets_write(worksheet.append_row, new_row_list, value_input_option='USER_ENTERED')
                         
                         mail_url = create_works_mail_url(
                             edited_data, user_inputs, {
@@ -638,6 +1075,7 @@ def register_lotte_contract(worksheet, all_df):
 
                         del st.session_state.extracted_data
                         del st.session_state.last_uploaded_filename
+                        st.session_state.pop('pdf_template', None)
                         st.rerun()
 
                     except Exception as e:
@@ -677,12 +1115,12 @@ def edit_contract(worksheet, user_df):
                     # gspread는 1-based index를 사용합니다.
                     # B, C, D... 열에 해당. A열(담당자)은 1, B열은 2...
                     # 헤더를 기준으로 열 인덱스를 동적으로 찾기
-                    headers = worksheet.row_values(1)
+                    headers = sheets_read('row_values:1', worksheet.row_values, 1)
                     office_col = headers.index('계약접수처') + 1
                     inflow_col = headers.index('유입경로') + 1
 
-                    worksheet.update_cell(row_to_edit_index, office_col, new_reception_office)
-                    worksheet.update_cell(row_to_edit_index, inflow_col, new_inflow_channel)
+                    sheets_write(worksheet.update_cell, row_to_edit_index, office_col, new_reception_office)
+                    sheets_write(worksheet.update_cell, row_to_edit_index, inflow_col, new_inflow_channel)
                     
                     st.success("계약 정보가 성공적으로 수정되었습니다.")
                     st.info("페이지가 곧 새로고침됩니다.")
@@ -714,19 +1152,118 @@ def cancel_contract(worksheet, user_df):
             row_to_cancel_index = selected_row['row_index']
             
             try:
-                headers = worksheet.row_values(1)
+                headers = sheets_read('row_values:1', worksheet.row_values, 1)
                 if '상태' not in headers:
                     st.error("시트에 '상태' 컬럼이 없습니다. '상태' 컬럼을 추가해주세요.")
                     return
                 
                 status_col = headers.index('상태') + 1
-                worksheet.update_cell(row_to_cancel_index, status_col, "취소")
+                sheets_write(worksheet.update_cell, row_to_cancel_index, status_col, "취소")
                 st.success("계약이 성공적으로 취소 처리되었습니다.")
                 st.info("페이지가 곧 새로고침됩니다.")
                 st.rerun()
             except Exception as e:
                 st.error(f"취소 처리 중 오류가 발생했습니다: {e}")
 
+# 내보내기 파일을 한 번에 만들지 않고 이 행 수만큼씩 나누어 기록
+EXPORT_CHUNK_SIZE = 500
+# XLSX에서 합계를 낼 수 있도록 숫자로 변환해 기록하는 컬럼
+EXPORT_NUMERIC_COLUMNS = ['월대여료', '접수처월별', '전체월별']
+
+def to_export_number(value):
+    """'550,000' 같은 시트 문자열을 숫자로 바꿉니다. 숫자가 아니면 원래 값을 반환합니다."""
+    text = str(value).replace(',', '').strip()
+    if re.fullmatch(r'-?\d+', text):
+        return int(text)
+    if re.fullmatch(r'-?\d+\.\d+', text):
+        return float(text)
+    return value
+
+def iter_contract_export_chunks(df, row_positions, columns, chunk_size=EXPORT_CHUNK_SIZE):
+    """내보낼 행을 chunk_size 단위로 잘라 행 목록을 순서대로 생성합니다."""
+    column_positions = [df.columns.get_loc(col) for col in columns]
+    for start in range(0, len(row_positions), chunk_size):
+        # 전체 결과를 복사하지 않고 현재 구간의 행만 꺼냄
+        chunk = df.iloc[row_positions[start:start + chunk_size], column_positions]
+        if '날짜' in chunk.columns:
+            chunk = chunk.assign(날짜=chunk['날짜'].dt.strftime('%Y-%m-%d'))
+        yield chunk.fillna('').values.tolist()
+
+def build_contract_export_file(df, row_positions, columns, file_format):
+    """선택된 계약 행을 CSV 또는 XLSX 파일로 만들어 BytesIO로 반환합니다."""
+    # download_button이 받을 수 있는 형식이어야 하므로 BytesIO에 기록
+    buffer = io.BytesIO()
+    if file_format == 'XLSX':
+        from openpyxl import Workbook
+
+        # write_only 모드는 행을 순서대로 흘려 쓰므로 시트 전체를 메모리에 두지 않음
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet("계약내역")
+        sheet.append(columns)
+        numeric_positions = [i for i, col in enumerate(columns) if col in EXPORT_NUMERIC_COLUMNS]
+        for rows in iter_contract_export_chunks(df, row_positions, columns):
+            for row in rows:
+                for i in numeric_positions:
+                    row[i] = to_export_number(row[i])
+                sheet.append(row)
+        workbook.save(buffer)
+    else:
+        # 엑셀에서 한글이 깨지지 않도록 BOM을 붙여서 기록
+        text_stream = io.TextIOWrapper(buffer, encoding='utf-8-sig', newline='')
+        writer = csv.writer(text_stream)
+        writer.writerow(columns)
+        for rows in iter_contract_export_chunks(df, row_positions, columns):
+            writer.writerows(rows)
+        text_stream.flush()
+        text_stream.detach()
+    buffer.seek(0)
+    return buffer
+
+def export_contracts(df):
+    """담당자와 기간을 선택해 계약 내역을 CSV/XLSX 파일로 내보냅니다."""
+    import pandas as pd
+
+    st.header("📤 계약 내역 내보내기")
+    st.info("월말 정산용으로 담당자와 기간을 선택해 계약 내역을 내려받으세요.")
+
+    salesperson_options = ['전체'] + sorted(name for name in df['담당자'].unique() if name)
+    default_index = salesperson_options.index(st.session_state['sales_person']) if st.session_state['sales_person'] in salesperson_options else 0
+    selected_salesperson = st.selectbox("담당자", salesperson_options, index=default_index)
+
+    today = datetime.now().date()
+    date_range = st.date_input("기간", value=(today.replace(day=1), today))
+    if len(date_range) != 2:
+        st.info("기간의 시작일과 종료일을 모두 선택해주세요.")
+        return
+    start_date, end_date = date_range
+
+    include_canceled = st.checkbox("취소된 계약 포함")
+    file_format = st.radio("파일 형식", ('CSV', 'XLSX'), horizontal=True)
+
+    mask = (df['날짜'] >= pd.Timestamp(start_date)) & (df['날짜'] < pd.Timestamp(end_date + timedelta(days=1)))
+    if selected_salesperson != '전체':
+        mask &= df['담당자'] == selected_salesperson
+    if not include_canceled and '상태' in df.columns:
+        mask &= df['상태'] != '취소'
+    row_positions = mask.to_numpy().nonzero()[0]
+
+    st.caption(f"대상 계약: {len(row_positions)}건")
+    if len(row_positions) == 0:
+        st.info("선택한 조건에 해당하는 계약이 없습니다.")
+        return
+
+    columns = [col for col in df.columns if col not in ('row_index', 'display')]
+    extension = file_format.lower()
+    mime = "text/csv" if file_format == 'CSV' else "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    # 파일은 버튼을 눌렀을 때 생성되도록 함수로 넘김
+    st.download_button(
+        label=f"📥 {file_format} 파일 다운로드",
+        data=lambda: build_contract_export_file(df, row_positions, columns, file_format),
+        file_name=f"계약내역_{selected_salesperson}_{start_date:%Y%m%d}-{end_date:%Y%m%d}.{extension}",
+        mime=mime,
+        use_container_width=True
+    )
+
 def create_works_mail_url(extracted_data, user_inputs, calculated_totals, commission, incentive, delivery_date, is_additional, is_referral):
     """Naver Works Mail 작성 URL을 생성합니다. (투입일자 추가 버전)"""
     # (기존 변수 선언은 동일)
@@ -0,0 +1,420 @@
+"""계약서웹버전.py 동시 접속 부하 테스트
+
+Streamlit AppTest로 여러 세션을 동시에 띄워 로그인 → 조회 → 등록 → 수정 → 취소를
+실행합니다. Google Sheets 대신 지연 시간과 429(할당량 초과) 오류를 흉내 내는
+메모리 시트를 사용하므로 실제 시트나 인증 정보 없이 실행할 수 있습니다.
+
+사용 예:
+    python 부하테스트.py --sessions 10 --salespeople 3
+
+결과로 동작별 p50/p95 지연 시간, 동작별 API 호출 수, 월별 댓수(접수처월별/전체월별)가
+동시 등록 상황에서도 중복이나 누락 없이 매겨졌는지를 출력합니다.
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from unittest import mock
+
+import gspread
+import requests
+import streamlit as st
+from streamlit.runtime.runtime import Runtime
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.runtime.secrets import Secrets
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "계약서웹버전.py")
+SHEET_HEADERS = ['담당자', '고객명', '계약접수처', '유입경로', '날짜', '접수처월별', '전체월별', '상태', '추가', '소개', '대여차종', '월대여료', '파일해시']
+ACTIONS = ['login', 'view', 'register', 'edit', 'cancel']
+# 다른 세션 때문에 계약 선택이 초기화될 때 다시 선택해 보는 횟수
+SELECT_RETRIES = 5
+
+# 세션 스레드(및 그 세션의 스크립트 실행 스레드)에서 현재 진행 중인 동작 이름
+_current_action = threading.local()
+
+class HarnessLookupError(Exception):
+    """앱 오류가 아니라 테스트 진행에 필요한 화면 상태를 만들지 못한 경우입니다."""
+
+# --------------------------------------------------------------------------
+# 1. 메모리 시트 (gspread 워크시트 대역)
+# --------------------------------------------------------------------------
+
+class FakeWorksheet:
+    """지연 시간과 분당 할당량을 흉내 내는 메모리 워크시트입니다."""
+
+    def __init__(self, latency_range, quota_per_minute, seed=None):
+        self.rows = [list(SHEET_HEADERS)]
+        self.latency_range = latency_range
+        self.quota_per_minute = quota_per_minute
+        self.call_counts = Counter()
+        # 동작별 호출 수 (동작 밖에서의 호출, 예: 로그인 화면의 미리 읽기는 None)
+        self.action_call_counts = Counter()
+        self.quota_errors = 0
+        self._random = random.Random(seed)
+        self._call_times = deque()
+        self._lock = threading.Lock()
+
+    def _api_call(self, method):
+        """호출 수를 기록하고, 할당량을 넘으면 429 오류를 발생시킨 뒤 지연 시간을 적용합니다."""
+        with self._lock:
+            now = time.monotonic()
+            while self._call_times and now - self._call_times[0] > 60:
+                self._call_times.popleft()
+            self.call_counts[method] += 1
+            self.action_call_counts[getattr(_current_action, 'name', None)] += 1
+            if len(self._call_times) >= self.quota_per_minute:
+                self.quota_errors += 1
+                raise gspread.exceptions.APIError(_quota_exceeded_response())
+            self._call_times.append(now)
+            latency = self._random.uniform(*self.latency_range)
+        time.sleep(latency)
+
+    def total_calls(self):
+        with self._lock:
+            return sum(self.call_counts.values())
+
+    def get_all_values(self):
+        self._api_call('get_all_values')
+        with self._lock:
+            return [list(row) for row in self.rows]
+
+    def row_values(self, row):
+        self._api_call('row_values')
+        with self._lock:
+            return list(self.rows[row - 1]) if row <= len(self.rows) else []
+
+    def append_row(self, values, value_input_option=None):
+        self._api_call('append_row')
+        with self._lock:
+            self.rows.append(['' if value is None else str(value) for value in values])
+
+    def update_cell(self, row, col, value):
+        self._api_call('update_cell')
+        with self._lock:
+            target_row = self.rows[row - 1]
+            target_row.extend([''] * (col - len(target_row)))
+            target_row[col - 1] = str(value)
+
+class FakeSpreadsheet:
+    def __init__(self, worksheet):
+        self._worksheet = worksheet
+
+    def get_worksheet(self, index):
+        if index != 0:
+            raise IndexError(index)
+        self._worksheet._api_call('fetch_sheet_metadata')
+        return self._worksheet
+
+class FakeClient:
+    def __init__(self, worksheet):
+        self._worksheet = worksheet
+
+    def open(self, title):
+        return FakeSpreadsheet(self._worksheet)
+
+def _quota_exceeded_response():
+    """Sheets API의 429 응답과 같은 형태의 응답 객체를 만듭니다."""
+    response = requests.Response()
+    response.status_code = 429
+    response._content = json.dumps({'error': {
+        'code': 429,
+        'message': "Quota exceeded for quota metric 'Read requests' (simulated)",
+        'status': 'RESOURCE_EXHAUSTED'
+    }}).encode('utf-8')
+    return response
+
+# --------------------------------------------------------------------------
+# 2. 세션 시나리오
+# --------------------------------------------------------------------------
+
+def _collect_errors(at):
+    """화면에 표시된 오류 메시지와 예외를 모아 반환합니다."""
+    return [element.value for element in at.error] + [str(element.value) for element in at.exception]
+
+def _timed(at, results, session_name, action, step):
+    """step을 실행하고 동작별 지연 시간과 오류를 기록합니다. 다음 동작을 진행할 수 있으면 True를 반환합니다.
+
+    앱이 표시한 오류(errors)와, 필요한 화면 요소를 찾지 못해 테스트를 진행할 수 없었던
+    경우(harness_errors)를 나누어 기록합니다.
+    """
+    started_at = time.perf_counter()
+    harness_errors = []
+    _current_action.name = action
+    try:
+        step()
+    except (KeyError, IndexError, StopIteration, HarnessLookupError) as e:
+        # 앞선 오류나 다른 세션의 변경으로 화면이 달라져 필요한 입력 요소를 찾지 못한 경우
+        harness_errors.append(f"화면 요소를 찾지 못해 중단: {e!r}")
+    finally:
+        _current_action.name = None
+    results.append({
+        'session': session_name,
+        'action': action,
+        'seconds': time.perf_counter() - started_at,
+        'errors': _collect_errors(at),
+        'harness_errors': harness_errors,
+    })
+    return not harness_errors
+
+def _ensure_contract_selected(at, customer_name):
+    """계약 선택 상자에서 고객명이 일치하는 계약이 선택된 상태로 만듭니다.
+
+    다른 세션이 계약을 등록하거나 취소하면 선택지가 바뀌어 선택이 초기화되므로,
+    선택한 뒤 다시 실행하여 선택이 유지되었는지 확인하고 초기화되었으면 다시 선택합니다.
+    해당 계약이 선택지에 없으면 False를 반환합니다.
+    """
+    for _ in range(SELECT_RETRIES):
+        selectbox = next((sb for sb in at.selectbox if sb.placeholder == "계약 선택..."), None)
+        if selectbox is None:
+            return False
+        option = next((opt for opt in selectbox.options if opt.endswith(f"/ {customer_name}")), None)
+        if option is None:
+            return False
+        if selectbox.value == option:
+            return True
+        selectbox.set_value(option)
+        at.run()
+    raise HarnessLookupError(f"계약 선택이 {SELECT_RETRIES}회 연속 초기화됨")
+
+def run_session(session_name, sales_person, timeout, results, seed=None):
+    """한 명의 담당자 세션으로 로그인부터 계약 취소까지 차례로 실행합니다."""
+    customer_name = f"부하고객-{session_name}"
+    rng = random.Random(None if seed is None else f"{seed}:{session_name}")
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    at.run()
+
+    def login():
+        at.text_input(key="login_name_input").input(sales_person)
+        at.button(key="login_button").click()
+        at.run()
+
+    def view():
+        at.sidebar.radio[0].set_value('내 계약 조회')
+        at.run()
+
+    def register():
+        at.sidebar.radio[0].set_value('계약 등록')
+        at.run()
+        form_inputs = {ti.label: ti for ti in at.text_input if ti.form_id == "novadeal_contract_form"}
+        form_inputs["고객명"].input(customer_name)
+        form_inputs["대여차종"].input("부하테스트 차량")
+        form_inputs["월대여료"].input(str(rng.randint(300, 900) * 1000))
+        next(btn for btn in at.button if btn.form_id == "novadeal_contract_form").click()
+        at.run()
+
+    # 수정/취소 버튼을 누르는 실행에서 선택이 초기화되면 요청이 처리되지 않으므로,
+    # 반영되었는지 확인하고 반영되지 않았으면 다시 선택하여 누름
+    def edit():
+        at.sidebar.radio[0].set_value('계약 수정')
+        at.run()
+        for _ in range(SELECT_RETRIES):
+            # 등록이 실패한 경우 수정할 계약이 없음
+            if not _ensure_contract_selected(at, customer_name):
+                return
+            form_inputs = {ti.label: ti for ti in at.text_input if ti.form_id == "edit_form"}
+            if form_inputs["유입경로"].value == "지인":
+                return
+            form_inputs["유입경로"].input("지인")
+            next(btn for btn in at.button if btn.form_id == "edit_form").click()
+            at.run()
+        raise HarnessLookupError(f"수정이 {SELECT_RETRIES}회 시도 후에도 반영되지 않음")
+
+    def cancel():
+        at.sidebar.radio[0].set_value('계약 취소')
+        at.run()
+        for _ in range(SELECT_RETRIES):
+            # 취소된 계약은 선택지에서 빠짐
+            if not _ensure_contract_selected(at, customer_name):
+                return
+            next(btn for btn in at.button if btn.label.startswith("🔴")).click()
+            at.run()
+        raise HarnessLookupError(f"취소가 {SELECT_RETRIES}회 시도 후에도 반영되지 않음")
+
+    for action, step in zip(ACTIONS, [login, view, register, edit, cancel]):
+        if not _timed(at, results, session_name, action, step):
+            break
+
+# --------------------------------------------------------------------------
+# 3. 실행 및 결과 집계
+# --------------------------------------------------------------------------
+
+def _percentile(values, percent):
+    """nearest-rank 방식으로 백분위수를 계산합니다."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, round(percent / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+@contextmanager
+def concurrent_app_test(worksheet):
+    """여러 AppTest를 한 프로세스에서 동시에 실행할 수 있도록 준비합니다.
+
+    AppTest는 한 번에 하나의 앱만 실행한다고 가정하고 몇몇 전역 상태를 실행마다
+    바꿨다가 되돌립니다. 동시에 실행하면 이 상태가 서로 엇갈리므로 다음을 고정합니다.
+    - gspread 연결: 모든 세션이 같은 메모리 시트를 사용
+    - st.secrets: 실행마다 교체하지 않도록 인증 정보를 미리 넣어 둠
+    - Runtime 인스턴스: 다른 세션의 실행이 끝나 None으로 돌려놓아도 마지막 인스턴스를 사용
+    - 스크립트 컴파일: 여러 스레드에서 동시에 ast.parse를 호출하면 Python 3.11에서
+      SystemError가 발생할 수 있어 컴파일만 직렬화 (스크립트 실행과 API 호출은 동시에 진행)
+    - 스크립트 실행 스레드: 실행을 요청한 세션 스레드의 현재 동작 이름을 이어받아
+      API 호출을 동작별로 집계할 수 있게 함
+    """
+    secrets = Secrets()
+    secrets._secrets = {'gcp_service_account': {}}
+
+    original_get_bytecode = ScriptCache.get_bytecode
+    compile_lock = threading.Lock()
+
+    def serialized_get_bytecode(script_cache, script_path):
+        with compile_lock:
+            return original_get_bytecode(script_cache, script_path)
+
+    original_instance = Runtime.instance.__func__
+    last_instance = None
+
+    def shared_instance(cls):
+        nonlocal last_instance
+        if cls._instance is not None:
+            last_instance = cls._instance
+        return last_instance if last_instance is not None else original_instance(cls)
+
+    original_start = LocalScriptRunner.start
+
+    def start_with_current_action(runner):
+        action = getattr(_current_action, 'name', None)
+        run_script_thread = runner._run_script_thread
+
+        def run_script_thread_with_action():
+            _current_action.name = action
+            run_script_thread()
+
+        runner._run_script_thread = run_script_thread_with_action
+        original_start(runner)
+
+    with mock.patch.object(gspread, "service_account_from_dict", lambda info: FakeClient(worksheet)), \
+            mock.patch.object(st, "secrets", secrets), \
+            mock.patch.object(ScriptCache, "get_bytecode", serialized_get_bytecode), \
+            mock.patch.object(Runtime, "instance", classmethod(shared_instance)), \
+            mock.patch.object(LocalScriptRunner, "start", start_with_current_action):
+        yield
+
+def _reset_app_caches():
+    """세션 간 공유되는 연결과 API 관문을 초기화하여 새 메모리 시트를 사용하게 합니다."""
+    st.cache_resource.clear()
+    st.cache_data.clear()
+
+def measure_calls_per_action(args):
+    """한 세션만 실행하여 동작별 API 호출 수를 측정합니다."""
+    worksheet = FakeWorksheet((0, 0), quota_per_minute=10**9, seed=args.seed)
+    results = []
+    _reset_app_caches()
+    with concurrent_app_test(worksheet):
+        run_session("calibration", "측정담당자", args.timeout, results, seed=args.seed)
+    return dict(worksheet.action_call_counts)
+
+def run_load_test(args):
+    """여러 세션을 동시에 실행하고 결과를 반환합니다."""
+    worksheet = FakeWorksheet((args.latency_min_ms / 1000, args.latency_max_ms / 1000), args.quota_per_minute, seed=args.seed)
+    results = []
+    sales_people = [f"담당자{i + 1}" for i in range(args.salespeople)]
+    _reset_app_caches()
+    started_at = time.perf_counter()
+    with concurrent_app_test(worksheet):
+        with ThreadPoolExecutor(max_workers=args.sessions) as executor:
+            futures = [
+                executor.submit(run_session, f"s{i + 1}", sales_people[i % len(sales_people)], args.timeout, results,
+                                seed=args.seed)
+                for i in range(args.sessions)
+            ]
+            session_failures = [future.exception() for future in futures if future.exception()]
+    return worksheet, results, session_failures, time.perf_counter() - started_at
+
+def check_counters(worksheet):
+    """담당자별 이번 달 전체월별/접수처월별 댓수가 1부터 빠짐없이, 중복 없이 매겨졌는지 확인합니다."""
+    header = worksheet.rows[0]
+    this_month = datetime.now().strftime("%Y-%m")
+    grand_totals = defaultdict(list)
+    office_totals = defaultdict(list)
+    for row in worksheet.rows[1:]:
+        record = dict(zip(header, row))
+        if not record['날짜'].startswith(this_month):
+            continue
+        grand_totals[record['담당자']].append(int(record['전체월별']))
+        office_totals[(record['담당자'], record['계약접수처'])].append(int(record['접수처월별']))
+
+    problems = []
+    for label, totals in (("전체월별", grand_totals), ("접수처월별", office_totals)):
+        for key, values in totals.items():
+            expected = list(range(1, len(values) + 1))
+            if sorted(values) != expected:
+                problems.append(f"{label} {key}: {sorted(values)} (기대값 {expected})")
+    return problems
+
+def print_report(args, calls_per_action, worksheet, results, session_failures, elapsed):
+    """측정 결과를 표 형태로 출력합니다."""
+    print(f"\n=== 부하 테스트 결과: 세션 {args.sessions}개, 담당자 {args.salespeople}명, 총 {elapsed:.1f}초 ===")
+    print(f"{'동작':<10}{'횟수':>6}{'p50(초)':>10}{'p95(초)':>10}{'오류':>6}{'중단':>6}"
+          f"{'API 호출(단독)':>16}{'API 호출(동시 평균)':>18}")
+    for action in ACTIONS:
+        action_results = [r for r in results if r['action'] == action]
+        seconds = [r['seconds'] for r in action_results]
+        error_count = sum(1 for r in action_results if r['errors'])
+        harness_error_count = sum(1 for r in action_results if r['harness_errors'])
+        concurrent_calls = worksheet.action_call_counts[action] / max(len(action_results), 1)
+        print(f"{action:<10}{len(action_results):>6}{_percentile(seconds, 50):>10.2f}{_percentile(seconds, 95):>10.2f}"
+              f"{error_count:>6}{harness_error_count:>6}{calls_per_action.get(action, 0):>16}{concurrent_calls:>18.1f}")
+    print(f"동작 밖 호출(로그인 화면의 미리 읽기 등): 단독 {calls_per_action.get(None, 0)}회, "
+          f"동시 {worksheet.action_call_counts[None]}회")
+
+    total_calls = worksheet.total_calls()
+    print(f"\n동시 실행 API 호출: 총 {total_calls}회 (동작당 {total_calls / max(len(results), 1):.1f}회), "
+          f"429 오류 {worksheet.quota_errors}회")
+    print("메서드별 호출: " + ", ".join(f"{method} {count}" for method, count in sorted(worksheet.call_counts.items())))
+
+    problems = check_counters(worksheet)
+    if problems:
+        print(f"\n❌ 댓수 오류 {len(problems)}건:")
+        for problem in problems:
+            print(f"  - {problem}")
+    else:
+        print("\n✅ 댓수 정합성: 중복/누락 없음")
+
+    error_messages = Counter(message for r in results for message in r['errors'])
+    if error_messages:
+        print("\n화면 오류 메시지:")
+        for message, count in error_messages.most_common(10):
+            print(f"  - ({count}회) {message[:120]}")
+    harness_messages = Counter(message for r in results for message in r['harness_errors'])
+    if harness_messages:
+        print("\n테스트 진행 중단 (앱 오류가 아닌 화면 조작 실패):")
+        for message, count in harness_messages.most_common(10):
+            print(f"  - ({count}회) {message[:120]}")
+    for failure in session_failures:
+        print(f"세션 실행 실패: {failure!r}")
+
+def main():
+    parser = argparse.ArgumentParser(description="계약서웹버전.py 동시 접속 부하 테스트")
+    parser.add_argument("--sessions", type=int, default=10, help="동시에 실행할 세션 수")
+    parser.add_argument("--salespeople", type=int, default=3, help="세션들이 나눠 쓸 담당자 수 (적을수록 댓수 경합이 큼)")
+    parser.add_argument("--latency-min-ms", type=float, default=50, help="API 호출 최소 지연 시간(ms)")
+    parser.add_argument("--latency-max-ms", type=float, default=300, help="API 호출 최대 지연 시간(ms)")
+    parser.add_argument("--quota-per-minute", type=int, default=60, help="메모리 시트의 분당 할당량 (초과 시 429)")
+    parser.add_argument("--timeout", type=float, default=300, help="AppTest 한 번 실행의 제한 시간(초)")
+    parser.add_argument("--seed", type=int, default=None, help="지연 시간과 월대여료 난수 시드")
+    args = parser.parse_args()
+
+    calls_per_action = measure_calls_per_action(args)
+    worksheet, results, session_failures, elapsed = run_load_test(args)
+    print_report(args, calls_per_action, worksheet, results, session_failures, elapsed)
+
+if __name__ == "__main__":
+    main()